@@ -1,39 +1,329 @@
 import re
+import html
+import io
 import os
+import secrets
+import hmac
+import signal
 import logging
+import logging.handlers
+import queue
 import asyncio
-import requests
-import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ForceReply
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+try:
+    import h2
+except ImportError:
+    h2 = None
+from functools import partial, wraps
+from http import HTTPStatus
+from itertools import zip_longest
+from types import MappingProxyType
+from cachetools import TTLCache
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ForceReply, LinkPreviewOptions
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
+from telegram.ext import (
+    Application, CommandHandler, Defaults, CallbackQueryHandler, ContextTypes, MessageHandler, PersistenceInput, PicklePersistence, filters,
+)
+from render_api import (
+    json_loads, render_headers, get_headers, forget_render_key, seed_render_cache, stream_render_get, render_error_text,
+    render_get, render_post, render_put, render_patch, render_delete, close_http_client,
+)
 # --- CONFIGURATION ---
 TOKEN = os.environ.get("TOKEN")
-RENDER_URL = "https://api.render.com/v1"
-ADMIN_ID = [7728700576, 7753358925]
+PORT = int(os.environ.get("PORT", 10000))
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL") or os.environ.get("RENDER_EXTERNAL_URL")
+# Without a configured secret, generate one per process so the webhook never accepts unauthenticated POSTs.
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+# Point this at a persistent disk so logged-in API keys survive restarts; unset keeps sessions in memory only.
+PERSISTENCE_FILE = os.environ.get("PERSISTENCE_FILE")
+ADMIN_ID = frozenset(int(uid) for uid in os.environ.get("ADMIN_IDS", "7728700576,7753358925").split(",") if uid.strip())
+DEPLOY_STATUS_FANOUT = 10
+ENV_VARS_PAGE_LIMIT = 100
+TELEGRAM_TEXT_LIMIT = 4000
+BUTTON_LABEL_LIMIT = 30
+PICKER_COLUMNS = 2
+# Repeat taps on deploy/cancel/delete buttons within this window are answered client-side by Telegram; navigation is never cached.
+CALLBACK_CACHE_TIME = 5
+REFRESH_MEMORY = 10
+# Deploys, cancels and deletions still being handled; a second tap on the same button meanwhile is dropped.
+DEDUPED_ACTIONS = frozenset({"deploy", "canceldeploy", "delsvc"})
+# Callbacks that work without a Render API key; every other one is stopped before it reaches Render.
+KEYLESS_ACTIONS = frozenset({"broadcast", "admin_refresh", "get_ids", "logout"})
+RECENT_TAPS = TTLCache(maxsize=1024, ttl=CALLBACK_CACHE_TIME)
+PICKER_LABEL_LIMIT = 20
+# Telegram allows roughly 30 messages per second across all chats.
+BROADCAST_BATCH = 25
+TELEGRAM_POOL_SIZE = 64
+PICKER_COMMANDS = ["deploy", "deployinfo", "canceldeploy", "toggleautodeploy", "logs", "suspend", "resume", "listenv", "updatenv", "deletenv", "updatefullenv", "rename", "changestartcmd", "changebuildcmd", "updatebuildfilter", "deleteservice"]
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+BOT_COMMANDS = [
+    ("start", "Welcome and introduction"),
+    ("help", "View all commands and how to use them"),
+    ("login", "Connect your Render API key"),
+    ("logout", "Clear your session and API key"),
+    ("accountinfo", "See your Render account information"),
+    ("services", "List all services with details"),
+    ("deploy", "Trigger a new manual deployment"),
+    ("deployinfo", "Show the status of the most recent deploy"),
+    ("canceldeploy", "Stop an in-progress deployment"),
+    ("toggleautodeploy", "Turn ON or OFF auto deploy of a service"),
+    ("logs", "See logs of a deployed service"),
+    ("suspend", "Pause a running service"),
+    ("resume", "Start a suspended service"),
+    ("listenv", "View all env vars of a service"),
+    ("updatenv", "Add or update an env var"),
+    ("deletenv", "Delete an env var by its key"),
+    ("updatefullenv", "Bulk replace all env vars"),
+    ("rename", "Change name of a service"),
+    ("changestartcmd", "Change start command of a service"),
+    ("changebuildcmd", "Change build command of a service"),
+    ("updatebuildfilter", "Set ignored paths for builds"),
+    ("deleteservice", "Permanently delete a service"),
+]
+# A cancel request for these can only fail, so it is not sent.
+FINISHED_DEPLOY_STATUSES = frozenset({"live", "deactivated", "build_failed", "update_failed", "pre_deploy_failed", "canceled"})
+DEPLOY_STATUS_EMOJI = MappingProxyType({
+    "live": "✅",
+    "update_failed": "❌",
+    "build_failed": "❌",
+    "canceled": "❌",
+})
 
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+# --- STATIC MESSAGES ---
+WELCOME_TEXT = (
+    "<b>🤖 Render Management Bot</b>\n\n"
+    "<b>👋 Hello, {first_name}!</b> I am your mobile command center for Render.com, a cloud application hosting platform.\n\n"
+    "<b>🔻 I can help you directly from Telegram -</b>\n"
+    "• Manage and update services\n"
+    "• Update environment variables\n"
+    "• Monitor deployments.\n"
+    "• See service logs.\n\n"
+    "👉 Send /help to see the available commands and their usages.\n\n"
+    "<i>📌 You have to <b>/login</b> with your <b>Render API key</b> first, otherwise the management commands won't work.</i>"
+)
+HELP_TEXT = (
+    "📌 This bot is made to control Render's <b>web services</b> only.\n\n"
+    "<b>🛠 Available Commands & Usage</b>\n\n"
+    "• /accountinfo - See your Render account information.\n\n"
+    "<b>📋 Services</b>\n"
+    "• /services - List all services with details.\n"
+    "• /rename - Change name of a service.\n"
+    "• /changestartcmd - Change start command of a service.\n"
+    "• /changebuildcmd - Change build command of a service.\n"
+    "• /updatebuildfilter - Add ignored paths whose changes will not trigger a new build.\n"
+    "• /deleteservice - Permanently delete a service.\n\n"
+    "<b>🚀 Deployments</b>\n"
+    "• /deploy - Trigger a new manual deployment.\n"
+    "• /deployinfo - Show the status of the most recent deploy.\n"
+    "• /canceldeploy - Stop an in-progress deployment.\n"
+    "• /toggleautodeploy - Turn ON or OFF auto deploy of a service.\n"
+    "• /logs - See logs of a deployed service.\n"
+    "• /suspend - Pause a running service.\n"
+    "• /resume - Start a suspended service.\n\n"
+    "<b>🔑 Environment (Env) Vars</b>\n"
+    "• /listenv - View all keys and values for a service.\n"
+    "• /updatenv - Add or update a variable.\n"
+    "• /deletenv - Delete a specific variable by its key.\n"
+    "• /updatefullenv - Add multiple variables or bulk replace all with a new list.\n\n"
+    "<i>Note: Most commands will ask you to select a service first.</i>"
+)
+NO_SERVICES_TEXT = "📭 No services found."
+LOGIN_SUCCESS_TEXT = (
+    "✅ <b>Login successful!</b> You can now use management commands.\n\n"
+    + ("" if PERSISTENCE_FILE else "<i>📌 You have to re-login if the bot gets updates and so your API key gets cleared.</i>\n\n")
+    + "If you want to logout, send /logout and your API key will be cleared."
+)
+NOT_LOGGED_IN_TEXT = "❌ You are not logged in.\nSend /login"
+SERVICE_INFO_TEMPLATE = (
+    "<b>📄 Service Info: {name}</b>\n" + "—" * 20 + "\n"
+    "<b>🔗 Service url: </b><code>{url}</code>\n"
+    "<b>Service ID: </b><code>{id}</code>\n"
+    "<b>Status:</b> {status}\n"
+    "<b>Plan:</b> <code>{plan}</code>\n"
+    "<b>Region:</b> <code>{region}</code>\n"
+    "<b>Runtime:</b> <code>{runtime}</code>\n"
+    "<b>Branch:</b> <code>{branch}</code>\n"
+    "<b>Auto-Deploy:</b> <code>{auto_deploy}</code>\n"
+    "<b>Last Deploy:</b> {last_deploy}\n\n"
+    "<b>🛠 Build Command:</b>\n<code>{build_command}</code>\n\n"
+    "<b>🚀 Start Command:</b>\n<code>{start_command}</code>\n\n"
+    "<b>📅 Updated:</b> <code>{updated}</code>\n\n"
+    "👉 <a href='https://dashboard.render.com/web/{id}'>Tap here to view on <b>Render Dashboard</b></a>"
+)
+DEPLOY_INFO_TEMPLATE = (
+    "<b>🚀 Last Deploy Info</b>\n" + "—" * 12 + "\n"
+    "<b>Status:</b> {status_emoji} <code>{status}</code>\n"
+    "<b>ID:</b> <code>{id}</code>\n"
+    "<b>Trigger:</b> <code>{trigger}</code>\n\n"
+    "<b>📝 Commit Message:</b>\n<i>{commit_message}</i>\n\n"
+    "<b>🆔 Commit ID:</b>\n<code>{commit_id}</code>\n\n"
+    "<b>⏱ Finished:</b> <code>{finished}</code>"
+)
+ENV_VARS_HEADER = "<b>🔑 Env Vars:</b>\n" + "—" * 7 + "\n"
+ENV_VAR_ROW = "<b>{key}</b> = <code>{value}</code>\n\n"
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logger = logging.getLogger(__name__)
-# --- DUMMY SERVER FOR RENDER HEALTH CHECK ---
-class HealthCheckHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(b"Bot is active.")
-
-def run_health_server():
-    httpd = HTTPServer(('0.0.0.0', 10000), HealthCheckHandler)
-    httpd.serve_forever()
+
+def start_logging():
+    # Handlers only enqueue records; a listener thread does the stderr writes so logging never blocks the event loop.
+    log_queue = queue.SimpleQueue()
+    log_stream = logging.StreamHandler()
+    log_stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, log_stream)
+    logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+    logging.getLogger().setLevel(logging.INFO)
+    listener.start()
+    return listener
+# --- PREBUILT KEYBOARDS ---
+ADMIN_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📢 Broadcast a message", callback_data="broadcast")],
+    [InlineKeyboardButton("🔄 Refresh", callback_data="admin_refresh")],
+    [InlineKeyboardButton("🆔 Get all IDs", callback_data="get_ids")],
+])
+BACK_ROWS = {
+    cmd: [InlineKeyboardButton("⬅️ Back to services list", callback_data=f"back:{cmd}")]
+    for cmd in ["services", *PICKER_COMMANDS]
+}
+BACK_MARKUPS = {cmd: InlineKeyboardMarkup([row]) for cmd, row in BACK_ROWS.items()}
+LOGOUT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⚠️ Yes, I'm sure!", callback_data="logout:ok")],
+    [InlineKeyboardButton("❌ Cancel", callback_data="logout:cancel")],
+])
+# --- HTTP SERVER (HEALTH CHECK + WEBHOOK) ---
+HEALTH_RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 14\r\n"
+    b"Connection: close\r\n\r\n"
+    b"Bot is active."
+)
+WEBHOOK_RESPONSES = {
+    status: f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Length: 0\r\n\r\n".encode()
+    for status in (200, 400, 403, 404, 413)
+}
+# Idle keep-alive connections and slow uploads are dropped after this many seconds.
+HTTP_TIMEOUT = 30
+WEBHOOK_MAX_BODY = 1024 * 1024
+
+async def handle_webhook_post(application, path, headers, body):
+    if path != f"/{TOKEN}":
+        return 404
+    secret = headers.get("x-telegram-bot-api-secret-token", "")
+    if not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET.encode()):
+        return 403
+    try:
+        update = Update.de_json(json_loads(body), application.bot)
+    except (ValueError, TypeError, KeyError):
+        return 400
+    await application.update_queue.put(update)
+    return 200
+
+async def handle_http(application, reader, writer):
+    # Every request on a connection is routed on its own: Telegram's webhook POSTs become updates, anything else gets the health response.
+    connections = application.bot_data.setdefault("http_connections", set())
+    connections.add(writer)
+    try:
+        while True:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HTTP_TIMEOUT)
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {
+                name.strip().lower(): value.strip()
+                for name, _, value in (line.partition(":") for line in header_lines if line)
+            }
+            if method != "POST" or not WEBHOOK_URL:
+                writer.write(HEALTH_RESPONSE)
+                await writer.drain()
+                return
+            length = int(headers.get("content-length") or 0)
+            if length > WEBHOOK_MAX_BODY:
+                writer.write(WEBHOOK_RESPONSES[413])
+                await writer.drain()
+                return
+            body = await asyncio.wait_for(reader.readexactly(length), HTTP_TIMEOUT)
+            writer.write(WEBHOOK_RESPONSES[await handle_webhook_post(application, path, headers, body)])
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                return
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError, ConnectionError):
+        pass
+    finally:
+        connections.discard(writer)
+        writer.close()
+
+async def start_health_server(application):
+    application.bot_data["health_server"] = await asyncio.start_server(partial(handle_http, application), "0.0.0.0", PORT)
+
+async def stop_health_server(application):
+    server = application.bot_data.pop("health_server", None)
+    if server:
+        server.close()
+        for writer in list(application.bot_data.get("http_connections", ())):
+            writer.close()
+        await server.wait_closed()
 # --- RENDER API HELPERS ---
-def get_headers(context: ContextTypes.DEFAULT_TYPE):
-    api_key = context.user_data.get("api_key")
-    if not api_key:
-        return None
-    return {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json"
-    }
+RENDER_FANOUT_LIMIT = asyncio.Semaphore(DEPLOY_STATUS_FANOUT)
+# --- TELEGRAM HELPERS ---
+HTML_TAG_RE = re.compile(r"<(/?)([a-z-]+)[^>]*>")
+
+def split_lines(text, limit):
+    buf, size = [], 0
+    for line in text.splitlines(keepends=True):
+        if size + len(line) > limit and buf:
+            yield "".join(buf)
+            buf, size = [], 0
+        while len(line) > limit:
+            # Back off so a hard cut never lands inside a tag or an entity like &amp;.
+            cut = limit
+            for opener, closer in (("<", ">"), ("&", ";")):
+                start = line.rfind(opener, 0, cut)
+                if start > 0 and start > line.rfind(closer, 0, cut):
+                    cut = start
+            yield line[:cut]
+            line = line[cut:]
+        buf.append(line)
+        size += len(line)
+    if buf:
+        yield "".join(buf)
+
+def split_message(text, limit=TELEGRAM_TEXT_LIMIT):
+    # Tags still open where a chunk ends are closed there and reopened at the start of the next, so every chunk parses as HTML.
+    open_tags = []
+    for chunk in split_lines(text, limit):
+        prefix = "".join(tag for _, tag in open_tags)
+        for match in HTML_TAG_RE.finditer(chunk):
+            closing, name = match.group(1), match.group(2)
+            if not closing:
+                open_tags.append((name, match.group(0)))
+            elif any(open_name == name for open_name, _ in open_tags):
+                del open_tags[max(i for i, (open_name, _) in enumerate(open_tags) if open_name == name)]
+        yield prefix + chunk + "".join(f"</{name}>" for name, _ in reversed(open_tags))
+
+async def edit_long_message(query, text, reply_markup=None, **kwargs):
+    first, *rest = list(split_message(text)) or [text]
+    if not rest:
+        await query.edit_message_text(first, reply_markup=reply_markup, **kwargs)
+        return
+    await query.edit_message_text(first, **kwargs)
+    for chunk in rest[:-1]:
+        await query.message.reply_text(chunk, **kwargs)
+    await query.message.reply_text(rest[-1], reply_markup=reply_markup, **kwargs)
+def short_name(name, limit=BUTTON_LABEL_LIMIT):
+    if not name:
+        return "unnamed"
+    return name if len(name) <= limit else name[:limit - 1] + "…"
+
+async def reply_or_edit(update, text, reply_markup=None):
+    if update.message:
+        await update.message.reply_html(text, reply_markup=reply_markup)
+    else:
+        await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
 # --- COMMAND HANDLERS ---
 def save_user_data(user_id, username, first_name, last_name):
     username = str(username) if username else "No_Username"
@@ -65,47 +355,51 @@ def get_all_ids():
                 if user_id:
                     ids.append(int(user_id))
     except FileNotFoundError:
-        print("No users found yet.")
+        logger.info("No users found yet.")
     return ids
 
+def admin_only(handler):
+    @wraps(handler)
+    async def wrapper(update, context, *args):
+        if update.effective_user.id not in ADMIN_ID:
+            return
+        return await handler(update, context, *args)
+    return wrapper
+
+@admin_only
 async def admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id not in ADMIN_ID:
-        return
     try:
         bot_status_txt = (f"Total users: {count_users()}")
-    except:
+    except FileNotFoundError:
         bot_status_txt = "No User ID saved in the server. Users have not sent /start yet after updating the bot."
-    keyboard = [
-        [InlineKeyboardButton("📢 Broadcast a message", callback_data="broadcast")],
-        [InlineKeyboardButton("🔄 Refresh", callback_data="refresh")],
-        [InlineKeyboardButton("🆔 Get all IDs", callback_data="get_ids")],
-    ]
     if update.message:
-        await update.message.reply_text(bot_status_txt, reply_markup=InlineKeyboardMarkup(keyboard))
+        await update.message.reply_text(bot_status_txt, reply_markup=ADMIN_MARKUP)
     else:
         try:
-            await update.callback_query.edit_message_text(bot_status_txt, reply_markup=InlineKeyboardMarkup(keyboard))
-        except:
-            pass
+            await update.callback_query.edit_message_text(bot_status_txt, reply_markup=ADMIN_MARKUP)
+        except BadRequest:
+            logger.debug("Admin panel refresh left unchanged", exc_info=True)
 
+@admin_only
 async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not os.path.exists("users.txt"):
-        await message.reply_text("No users to broadcast to.")
+        await update.message.reply_text("No users to broadcast to.")
         return
     users = get_all_ids()
     status = await update.message.reply_text(f"🚀 Sending to {len(users)} users...")
     success = 0
-    failed = 0
-    for uid in users:
-        try:
-            await update.message.copy(chat_id=int(uid))
-            success += 1
-            await asyncio.sleep(0.05)
-        except:
-            failed += 1
+    for i in range(0, len(users), BROADCAST_BATCH):
+        if i:
+            await asyncio.sleep(1)
+        results = await asyncio.gather(
+            *(update.message.copy(chat_id=uid) for uid in users[i:i + BROADCAST_BATCH]),
+            return_exceptions=True
+        )
+        success += sum(not isinstance(result, Exception) for result in results)
+    failed = len(users) - success
     user_s = "users" if success > 1 else "user"
     fail_msg = f"\n❌ Failed {failed}" if failed > 0 else ""
-    await status.edit_text(f"✅ <b>Broadcast Done</b>\nSent to {success} {user_s}.{fail_msg}", parse_mode="HTML")
+    await status.edit_text(f"✅ <b>Broadcast Done</b>\nSent to {success} {user_s}.{fail_msg}")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -115,47 +409,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user.first_name, 
         user.last_name
     )
-    welcome_text = (
-        "<b>🤖 Render Management Bot</b>\n\n"
-        f"<b>👋 Hello, {user.first_name}!</b> I am your mobile command center for Render.com, a cloud application hosting platform.\n\n"
-        "<b>🔻 I can help you directly from Telegram -</b>\n"
-        "• Manage and update services\n"
-        "• Update environment variables\n"
-        "• Monitor deployments.\n"
-        "• See service logs.\n\n"
-        "👉 Send /help to see the available commands and their usages.\n\n"
-        "<i>📌 You have to <b>/login</b> with your <b>Render API key</b> first, otherwise the management commands won't work.</i>"
-    )
-    await update.message.reply_html(welcome_text)
+    await update.message.reply_html(WELCOME_TEXT.format(first_name=html.escape(user.first_name or "")))
     
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    help_text = (
-        "📌 This bot is made to control Render's <b>web services</b> only.\n\n"
-        "<b>🛠 Available Commands & Usage</b>\n\n"
-        "• /accountinfo - See your Render account information.\n\n"
-        "<b>📋 Services</b>\n"
-        "• /services - List all services with details.\n"
-        "• /rename - Change name of a service.\n"
-        "• /changestartcmd - Change start command of a service.\n"
-        "• /changebuildcmd - Change build command of a service.\n"
-        "• /updatebuildfilter - Add ignored paths whose changes will not trigger a new build.\n"
-        "• /deleteservice - Permanently delete a service.\n\n"
-        "<b>🚀 Deployments</b>\n"
-        "• /deploy - Trigger a new manual deployment.\n"
-        "• /deployinfo - Show the status of the most recent deploy.\n"
-        "• /canceldeploy - Stop an in-progress deployment.\n"
-        "• /toggleautodeploy - Turn ON or OFF auto deploy of a service.\n"
-        "• /logs - See logs of a deployed service.\n"
-        "• /suspend - Pause a running service.\n"
-        "• /resume - Start a suspended service.\n\n"
-        "<b>🔑 Environment (Env) Vars</b>\n"
-        "• /listenv - View all keys and values for a service.\n"
-        "• /updatenv - Add or update a variable.\n"
-        "• /deletenv - Delete a specific variable by its key.\n"
-        "• /updatefullenv - Add multiple variables or bulk replace all with a new list.\n\n"
-        "<i>Note: Most commands will ask you to select a service first.</i>"
-    )
-    await update.message.reply_html(help_text)
+    await update.message.reply_html(HELP_TEXT)
     
 async def login(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if "api_key" in context.user_data:
@@ -170,13 +427,13 @@ async def login(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def get_account_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     headers = get_headers(context)
     if not headers:
-        await update.message.reply_text("❌ You are not logged in.\nSend /login")
-    url = f"{RENDER_URL}/users"
-    r = requests.get(url, headers=headers)
+        await reply_or_edit(update, NOT_LOGGED_IN_TEXT)
+        return
+    r = await render_get("/users", context, cache=True)
     if r.status_code == 200:
-        data = r.json()
-        name = data.get("name", "N/A")
-        email = data.get("email", "N/A")
+        data = json_loads(r.content)
+        name = html.escape(data.get("name", "N/A"))
+        email = html.escape(data.get("email", "N/A"))
         info_message = ("👤 <b>Render Account Info</b>\n\n"
                         f"<b>Name:</b> {name}\n"
                         f"<b>Email:</b> <code>{email}</code>\n\n")
@@ -184,13 +441,9 @@ async def get_account_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
 async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if "api_key" in context.user_data:
-        keyboard = [
-            [InlineKeyboardButton("⚠️ Yes, I'm sure!", callback_data="logout_ok")],
-            [InlineKeyboardButton("❌ Cancel", callback_data="logout_cancel")]
-        ]
         await update.message.reply_html(
             "<b>Are you sure you really want to logout?</b>",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=LOGOUT_MARKUP
         )
     else:
         await update.message.reply_text("You weren't logged in!")
@@ -198,171 +451,282 @@ async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def services(update: Update, context: ContextTypes.DEFAULT_TYPE):
     headers = get_headers(context)
     if not headers:
-        await update.message.reply_text("❌ You are not logged in.\nSend /login")
-    res = requests.get(f"{RENDER_URL}/services?limit=50", headers=headers)
+        await reply_or_edit(update, NOT_LOGGED_IN_TEXT)
+        return
+    res = await render_get("/services", context, params={"limit": 50}, cache=True)
     if res.status_code == 200:
-        keyboard = []
-        for item in res.json():
-            svc = item['service']
-            status_emoji = "🟢" if svc['suspended'] == "not_suspended" else "🔴"
-            keyboard.append([InlineKeyboardButton(f"{status_emoji} {svc['name']}", callback_data=f"view_{svc['id']}")])
+        service_list = [item['service'] for item in json_loads(res.content)]
+        if not service_list:
+            await reply_or_edit(update, NO_SERVICES_TEXT)
+            return
+        # The list already carries each full service object, so the likely next tap (view:<id>) needs no request.
+        for svc in service_list:
+            seed_render_cache(context, f"/services/{svc['id']}", svc)
+        deploy_statuses = await asyncio.gather(
+            *(get_last_deploy_status(context, svc['id']) for svc in service_list[:DEPLOY_STATUS_FANOUT]),
+            return_exceptions=True
+        )
+        rows = [
+            (svc['id'], svc['name'], svc['suspended'], deploy_status if isinstance(deploy_status, str) else None)
+            for svc, deploy_status in zip_longest(service_list, deploy_statuses)
+        ]
+        # Refreshing an unchanged list reuses the keyboard built last time.
+        signature, reply_markup = context.user_data.get("services_view", (None, None))
+        if signature != rows:
+            keyboard = []
+            for svc_id, name, suspended, deploy_status in rows:
+                status_emoji = "🟢" if suspended == "not_suspended" else "🔴"
+                label = f"{status_emoji} {short_name(name)}"
+                if deploy_status:
+                    label += f" · {DEPLOY_STATUS_EMOJI.get(deploy_status, '⏳')}"
+                keyboard.append([InlineKeyboardButton(label, callback_data=f"view:{svc_id}")])
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            context.user_data["services_view"] = (rows, reply_markup)
         text = "<b>📋 Render Services List</b>\n"
-        if update.message:
-            await update.message.reply_html(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        else:
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="HTML")
+        await reply_or_edit(update, text, reply_markup)
 # --- FUNCTIONS ---
+async def get_last_deploy_status(context, svc_id):
+    async with RENDER_FANOUT_LIMIT:
+        r = await render_get(f"/services/{svc_id}/deploys", context, params={"limit": 1}, cache=True)
+    if r.status_code == 200:
+        deploys = json_loads(r.content)
+        if deploys:
+            return deploys[0]['deploy']['status']
+    return None
+
+def format_service_info(svc, deploy_status=None):
+    get = svc.get
+    details = get('serviceDetails') or {}
+    detail = details.get
+    env_detail = (detail('envSpecificDetails') or {}).get
+    return SERVICE_INFO_TEMPLATE.format_map({
+        "name": html.escape(svc['name']),
+        "url": detail('url'),
+        "id": svc['id'],
+        "status": "🟢 Active" if svc['suspended'] == "not_suspended" else "🔴 Suspended",
+        "plan": detail('plan', 'N/A'),
+        "region": detail('region', 'N/A'),
+        "runtime": detail('runtime', 'N/A'),
+        "branch": html.escape(get('branch') or 'main'),
+        "auto_deploy": get('autoDeploy', 'yes'),
+        "last_deploy": f"{DEPLOY_STATUS_EMOJI.get(deploy_status, '⏳')} <code>{deploy_status}</code>" if deploy_status else "<code>N/A</code>",
+        "build_command": html.escape(env_detail('buildCommand') or 'N/A'),
+        "start_command": html.escape(env_detail('startCommand') or 'N/A'),
+        "updated": svc['updatedAt'][:10],
+    })
+
 async def get_service_info(context, svc_id):
-    r = requests.get(f"{RENDER_URL}/services/{svc_id}", headers=get_headers(context))
+    r, deploy_status = await asyncio.gather(
+        render_get(f"/services/{svc_id}", context, cache=True),
+        get_last_deploy_status(context, svc_id)
+    )
     if r.status_code == 200:
-        svc = r.json()
-        details = svc.get('serviceDetails', {})
-        text = (
-            f"<b>📄 Service Info: {svc['name']}</b>\n" + "—" * 20 + "\n"
-            f"<b>🔗 Service url: </b><code>{details.get('url')}</code>\n"
-            f"<b>Service ID: </b><code>{svc['id']}</code>\n"
-            f"<b>Status:</b> {'🟢 Active' if svc['suspended'] == 'not_suspended' else '🔴 Suspended'}\n"
-            f"<b>Plan:</b> <code>{details.get('plan', 'N/A')}</code>\n"
-            f"<b>Region:</b> <code>{details.get('region', 'N/A')}</code>\n"
-            f"<b>Runtime:</b> <code>{details.get('runtime', 'N/A')}</code>\n"
-            f"<b>Branch:</b> <code>{svc.get('branch', 'main')}</code>\n"
-            f"<b>Auto-Deploy:</b> <code>{svc.get('autoDeploy', 'yes')}</code>\n\n"
-            f"<b>🛠 Build Command:</b>\n<code>{details.get('envSpecificDetails', {}).get('buildCommand', 'N/A')}</code>\n\n"
-            f"<b>🚀 Start Command:</b>\n<code>{details.get('envSpecificDetails', {}).get('startCommand', 'N/A')}</code>\n\n"
-            f"<b>📅 Updated:</b> <code>{svc['updatedAt'][:10]}</code>\n\n"
-            f"👉 <a href='https://dashboard.render.com/web/{svc['id']}'>Tap here to view on <b>Render Dashboard</b></a>"
-        )
+        text = format_service_info(json_loads(r.content), deploy_status)
     else:
         text = "❌ Error fetching service info."
-    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to services list", callback_data="back_services")]])
+    reply_markup=BACK_MARKUPS["services"]
     return text, reply_markup
 
 async def trigger_deploy(context, svc_id):
-    r = requests.post(f"{RENDER_URL}/services/{svc_id}/deploys", headers=get_headers(context))
+    # Render would queue another full build behind one that's still running, so that case is answered without a POST.
+    res = await render_get(f"/services/{svc_id}/deploys", context, params={"limit": 1})
+    deploys = json_loads(res.content) if res.status_code == 200 else None
+    if deploys and deploys[0]['deploy']['status'] not in FINISHED_DEPLOY_STATUSES:
+        text = f"⏳ A deploy is already running (<code>{deploys[0]['deploy']['status']}</code>).\nSend /canceldeploy to stop it first."
+        return text, BACK_MARKUPS["deploy"]
+    r = await render_post(f"/services/{svc_id}/deploys", context)
     if r.status_code == 201:
         text = "🚀 <b>Deploy triggered!</b>\nSend /logs to see runtime logs."
     else:
-        text = f"❌ Error triggering a deploy: {r.status_code}"
-    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to services list", callback_data="back_deploy")]])
+        text = render_error_text("Error triggering a deploy", r)
+    reply_markup=BACK_MARKUPS["deploy"]
     return text, reply_markup
 
 async def cancel_last_deploy(context, svc_id):
-    list_url = f"{RENDER_URL}/services/{svc_id}/deploys?limit=1"
-    res = requests.get(list_url, headers=get_headers(context))
+    res = await render_get(f"/services/{svc_id}/deploys", context, params={"limit": 1})
     if res.status_code == 200:
-        deploys = res.json()
+        deploys = json_loads(res.content)
+        current_status = deploys[0]['deploy']['status'] if deploys else None
         if not deploys:
             text = "❌ No deployment found to cancel."
-        deploy_id = deploys[0]['deploy']['id']
-        current_status = deploys[0]['deploy']['status']
-        if current_status in ["live", "build_failed", "canceled"]:
+        elif current_status in FINISHED_DEPLOY_STATUSES:
             text = f"⚠️ Cannot cancel. Last deploy is already <code>{current_status}</code>."
-        cancel_url = f"{RENDER_URL}/services/{svc_id}/deploys/{deploy_id}/cancel"
-        cancel_res = requests.post(cancel_url, headers=get_headers(context))
-        if cancel_res.status_code == 200:
-            text = f"🛑 <b>Deploy Cancelled!</b>"
         else:
-            text = f"❌ Failed to cancel"
+            cancel_res = await render_post(f"/services/{svc_id}/deploys/{deploys[0]['deploy']['id']}/cancel", context)
+            if cancel_res.status_code == 200:
+                text = "🛑 <b>Deploy Cancelled!</b>"
+            else:
+                text = render_error_text("Failed to cancel", cancel_res)
     else:
-        text = f"❌ Error fetching deploy ID: {res.status_code}"
-    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to services list", callback_data="back_canceldeploy")]])
+        text = render_error_text("Error fetching deploy ID", res)
+    reply_markup=BACK_MARKUPS["canceldeploy"]
     return text, reply_markup
     
-async def get_last_deploy(context, svc_id):
-    r = requests.get(f"{RENDER_URL}/services/{svc_id}/deploys?limit=1", headers=get_headers(context))
+async def get_last_deploy(context, svc_id, cache=False):
+    r = await render_get(f"/services/{svc_id}/deploys", context, params={"limit": 1}, cache=cache)
     if r.status_code == 200:
-        deploy = r.json()
+        deploy = json_loads(r.content)
         if not deploy:
             text = "No deployment history found for this service."
-        d = deploy[0]['deploy']
-        commit = d.get('commit', {})
-        status_emoji = "✅" if d['status'] == "live" else "❌" if d['status'] in ["update_failed", "build_failed", "canceled"] else "⏳"
-        text = (
-            f"<b>🚀 Last Deploy Info</b>\n" + "—" * 12 + "\n"
-            f"<b>Status:</b> {status_emoji} <code>{d['status']}</code>\n"
-            f"<b>ID:</b> <code>{d['id']}</code>\n"
-            f"<b>Trigger:</b> <code>{d['trigger']}</code>\n\n"
-            f"<b>📝 Commit Message:</b>\n<i>{commit.get('message', 'N/A')}</i>\n\n"
-            f"<b>🆔 Commit ID:</b>\n<code>{commit.get('id', 'N/A')[:7]}</code>\n\n"
-            f"<b>⏱ Finished:</b> <code>{d.get('finishedAt', 'N/A')}</code>"
-        )
+        else:
+            d = deploy[0]['deploy']
+            commit = d.get('commit', {})
+            text = DEPLOY_INFO_TEMPLATE.format_map({
+                "status_emoji": DEPLOY_STATUS_EMOJI.get(d['status'], "⏳"),
+                "status": d['status'],
+                "id": d['id'],
+                "trigger": d['trigger'],
+                "commit_message": html.escape(commit.get('message') or 'N/A'),
+                "commit_id": commit.get('id', 'N/A')[:7],
+                "finished": d.get('finishedAt', 'N/A'),
+            })
     else:
-        text = f"❌ Error fetching deploy info: {r.status_code}"
+        text = render_error_text("Error fetching deploy info", r)
     keyboard = [
-        [InlineKeyboardButton("🔄 Refresh info", callback_data=f"refresh_deploy_{svc_id}")],
-        [InlineKeyboardButton("⬅️ Back to services list", callback_data="back_deployinfo")]
+        [InlineKeyboardButton("🔄 Refresh info", callback_data=f"refresh:deploy:{svc_id}")],
+        BACK_ROWS["deployinfo"]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     return text, reply_markup
 
+async def patch_service(context, svc_id, payload, success_text, failure):
+    r = await render_patch(f"/services/{svc_id}", context, json=payload)
+    if r.status_code == 200:
+        # PATCH answers with the updated service, so the next info view needn't refetch it.
+        seed_render_cache(context, f"/services/{svc_id}", json_loads(r.content))
+        return success_text
+    return render_error_text(failure, r)
+
 async def toggle_auto_deploy(context, svc_id, status):
     payload = {"autoDeploy": "yes" if status == "on" else "no"}
-    url = f"{RENDER_URL}/services/{svc_id}"
-    r = requests.patch(url, json=payload, headers=get_headers(context))
-    if r.status_code == 200:
-        icon = "✅" if status == "on" else "🛑"
-        text = f"{icon} <b>Auto-Deploy</b> is now <b>{status.upper()}</b> for your service."
-    else:
-        text = f"❌ Failed to update: {r.text}"
-    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data=f"toggleautodeploy_{svc_id}")]])
+    icon = "✅" if status == "on" else "🛑"
+    text = await patch_service(context, svc_id, payload, f"{icon} <b>Auto-Deploy</b> is now <b>{status.upper()}</b> for your service.", "Failed to update")
+    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data=f"toggleautodeploy:{svc_id}")]])
     return text, reply_markup
 
+def remember_owner_id(context, owners_res):
+    owners_data = json_loads(owners_res.content)
+    if owners_data:
+        context.user_data["owner_id"] = owners_data[0]['owner']['id']
+    return context.user_data.get("owner_id")
+
+async def get_owner_id(context):
+    # The owner never changes for an API key, so it's fetched once (normally at login) and kept in user_data.
+    owner_id = context.user_data.get("owner_id")
+    if owner_id is None:
+        owner_res = await render_get("/owners", context, cache=True)
+        if owner_res.status_code == 200:
+            owner_id = remember_owner_id(context, owner_res)
+    return owner_id
+
 async def get_service_logs(context, svc_id):
-    owner_res = requests.get(f"{RENDER_URL}/owners", headers=get_headers(context))
-    if owner_res.status_code != 200:
-        text = "❌ Failed to retrieve Owner ID."
-    owners_data = owner_res.json()
-    if not owners_data:
-        text = "❌ No owner found for this account."
-    owner_id = owners_data[0]['owner']['id']
-    log_url = f"{RENDER_URL}/logs"
+    document = None
+    keyboard = [
+        [InlineKeyboardButton("🔄 Refresh Logs", callback_data=f"refresh:logs:{svc_id}")],
+        BACK_ROWS["logs"]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    owner_id = await get_owner_id(context)
+    if owner_id is None:
+        return "❌ Failed to retrieve Owner ID.", reply_markup, document
     params = {
         "ownerId": owner_id,
         "direction": "backward",
         "resource": svc_id,
         "limit": 10
     }
-    log_res = requests.get(log_url, headers=get_headers(context), params=params)
-    if log_res.status_code == 200:
-        logs_json = log_res.json()
+    status_code, body = await stream_render_get("/logs", context, params=params)
+    if status_code == 200:
+        logs_json = json_loads(body)
         log_entries = logs_json.get("logs", [])
-        if not log_entries:
-            return "📭 No logs found for this service."
-        formatted_logs = ""
-        for log in log_entries:
-            msg = log.get("message", "").strip()
-            formatted_logs += f"• `{msg}`\n\n"
-        text = f"📋 **Recent Logs:**\n\n{formatted_logs}"
+        messages = [log.get("message", "").strip() for log in log_entries]
+        parts = ["📋 **Recent Logs:**\n\n"]
+        total = len(parts[0])
+        for msg in messages:
+            line = f"• `{msg}`\n\n"
+            total += len(line)
+            if total > TELEGRAM_TEXT_LIMIT:
+                break
+            parts.append(line)
+        text = "".join(parts) if messages else "📭 No logs found for this service."
+        if total > TELEGRAM_TEXT_LIMIT:
+            document = io.BytesIO("\n".join(messages).encode("utf-8"))
+            document.name = f"{svc_id}.log"
+            text = "📋 **Recent Logs** were too long for a message, so they were sent as a file."
     else:
-        text = f"❌ Failed to fetch logs: {log_res.text}"
-    keyboard = [
-        [InlineKeyboardButton("🔄 Refresh Logs", callback_data=f"refresh_logs_{svc_id}")],
-        [InlineKeyboardButton("⬅️ Back to services list", callback_data="back_logs")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    return text, reply_markup
+        text = f"❌ Failed to fetch logs: {body.decode('utf-8', 'replace')}"
+    return text, reply_markup, document
         
+async def list_env_vars(context, svc_id, cache=True):
+    # Render pages env vars (20 by default); ask for the max page size and follow the cursor only when a page comes back full.
+    params = {"limit": ENV_VARS_PAGE_LIMIT}
+    env_vars = []
+    while True:
+        r = await render_get(f"/services/{svc_id}/env-vars", context, cache=cache, params=params)
+        if r.status_code != 200:
+            return r, None
+        page = json_loads(r.content)
+        env_vars.extend(page)
+        if len(page) < ENV_VARS_PAGE_LIMIT:
+            return r, env_vars
+        params = {"limit": ENV_VARS_PAGE_LIMIT, "cursor": page[-1]["cursor"]}
+
 async def fetch_env_vars(context, svc_id):
-    r = requests.get(f"{RENDER_URL}/services/{svc_id}/env-vars", headers=get_headers(context))
-    if r.status_code == 200:
-        vars_list = "\n".join([f"<b>{v['envVar']['key']}</b> = <code>{v['envVar']['value']}</code>\n" for v in r.json()])
-        text = f"<b>🔑 Env Vars:</b>\n" + "—" * 7 + "\n" f"{vars_list}" if vars_list else "No variables found."
+    r, env_vars = await list_env_vars(context, svc_id)
+    if env_vars is not None:
+        if env_vars:
+            parts = [ENV_VARS_HEADER]
+            for v in env_vars:
+                env_var = v['envVar']
+                parts.append(ENV_VAR_ROW.format_map({"key": html.escape(env_var['key']), "value": html.escape(env_var['value'])}))
+            text = "".join(parts).rstrip("\n")
+        else:
+            text = "No variables found."
     else:
-        text = f"❌ Error fetching env: {r.status_code}"
-    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to services list", callback_data="back_listenv")]])
+        text = render_error_text("Error fetching env", r)
+    reply_markup = BACK_MARKUPS["listenv"]
     return text, reply_markup
 
+# Each line of a multi-variable /updatenv reply must start like this; anything else is one multi-line value.
+ENV_PAIR_RE = re.compile(r"^\s*[A-Za-z_][A-Za-z0-9_]*\s*=")
+
 async def update_env_variable(context, svc_id, user_input):
     if "=" not in user_input:
         return "❌ Invalid format. Please use: <code>KEY = VALUE</code>"
-    key, value = [x.strip() for x in user_input.split("=", 1)]
-    url = f"{RENDER_URL}/services/{svc_id}/env-vars/{key}"
-    payload = {"value": value}
-    r = requests.put(url, json=payload, headers=get_headers(context))
-    if r.status_code == 200:
-        return f"✅ Successfully set <code>{value}</code> to <code>{key}</code>"
+    lines = [line for line in user_input.splitlines() if line.strip()]
+    if len(lines) > 1 and all(ENV_PAIR_RE.match(line) for line in lines):
+        pairs = [[x.strip() for x in line.split("=", 1)] for line in lines]
     else:
-        return f"❌ Failed to update: {r.text}"
+        # A single variable whose value may itself span several lines (certificates, keys, base64 with '=' padding).
+        pairs = [[x.strip() for x in user_input.split("=", 1)]]
+    results = await asyncio.gather(
+        *(render_put(f"/services/{svc_id}/env-vars/{key}", context, json={"value": value}) for key, value in pairs)
+    )
+    if len(pairs) == 1:
+        (key, value), r = pairs[0], results[0]
+        if r.status_code == 200:
+            return f"✅ Successfully set <code>{html.escape(value)}</code> to <code>{html.escape(key)}</code>"
+        else:
+            return render_error_text("Failed to update", r)
+    return "\n".join(
+        f"✅ <code>{html.escape(key)}</code>" if r.status_code == 200 else render_error_text(f"<code>{html.escape(key)}</code>", r)
+        for (key, _), r in zip(pairs, results)
+    )
+
+async def replace_env_vars(context, svc_id, payload):
+    # A full PUT replaces every variable; when only a few values change and none are dropped, update those keys in parallel instead.
+    # Whether anything would be dropped is decided from a fresh listing, never the GET cache.
+    _, env_vars = await list_env_vars(context, svc_id, cache=False)
+    if env_vars is not None:
+        current = {v['envVar']['key']: v['envVar']['value'] for v in env_vars}
+        wanted = {item["key"]: item["value"] for item in payload}
+        changed = {k: v for k, v in wanted.items() if current.get(k) != v}
+        if changed and current.keys() <= wanted.keys() and len(changed) * 2 <= len(wanted):
+            results = await asyncio.gather(
+                *(render_put(f"/services/{svc_id}/env-vars/{k}", context, json={"value": v}) for k, v in changed.items())
+            )
+            return next((r for r in results if r.status_code != 200), results[-1])
+    return await render_put(f"/services/{svc_id}/env-vars", context, json=payload)
 
 async def update_full_env(context, svc_id, user_input):
     lines = user_input.split('\n')
@@ -373,92 +737,69 @@ async def update_full_env(context, svc_id, user_input):
             payload.append({"key": k, "value": v})
     if not payload:
         return "❌ No valid <code>KEY = VALUE</code> pairs found."
-    url = f"{RENDER_URL}/services/{svc_id}/env-vars"
-    r = requests.put(url, json=payload, headers=get_headers(context))
+    r = await replace_env_vars(context, svc_id, payload)
     if r.status_code == 200:
         var_nmbr = int(len(payload))
         if var_nmbr > 1: var_s = "variables"
         else: var_s = "variable"
         return f"✅ Successfully replaced all variables for your service ({var_nmbr} {var_s})."
     else:
-        return f"❌ Bulk update failed: {r.text}"
+        return render_error_text("Bulk update failed", r)
         
 async def delete_env_variable(context, svc_id, key):
-    url = f"{RENDER_URL}/services/{svc_id}/env-vars/{key}"
-    r = requests.delete(url, headers=get_headers(context))
+    r = await render_delete(f"/services/{svc_id}/env-vars/{key}", context)
     if r.status_code == 204:
-        text = f"🗑 <b>Deleted:</b> Variable <code>{key}</code> from web service."
+        text = f"🗑 <b>Deleted:</b> Variable <code>{html.escape(key)}</code> from web service."
     elif r.status_code == 404:
-        text = f"❌ Variable <code>{key}</code> not found on this service."
+        text = f"❌ Variable <code>{html.escape(key)}</code> not found on this service."
     else:
-        text = f"❌ Failed to delete: {r.text}"
-    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data=f"deletenv_{svc_id}")]])
+        text = render_error_text("Failed to delete", r)
+    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data=f"deletenv:{svc_id}")]])
     return text, reply_markup
 
 async def toggle_suspension(context, svc_id, action):
-    r = requests.post(f"{RENDER_URL}/services/{svc_id}/{action}", headers=get_headers(context))
+    r = await render_post(f"/services/{svc_id}/{action}", context)
     status_text = "Suspended ⏸" if action == "suspend" else "Resumed ▶️"
-    text = f"Service {status_text}" if r.status_code == 202 else f"❌ {action} failed: {r.json()['message']}"
-    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to services list", callback_data=f"back_{action}")]])
+    text = f"Service {status_text}" if r.status_code == 202 else render_error_text(f"{action.capitalize()} failed", r)
+    reply_markup = BACK_MARKUPS[action]
     return text, reply_markup
 
 async def change_service_name(context, svc_id, user_input):
     payload = {"name": user_input}
-    url = f"{RENDER_URL}/services/{svc_id}"
-    r = requests.patch(url, json=payload, headers=get_headers(context))
-    if r.status_code == 200:
-        return f"✨ <b>Name Updated!</b>\nNew Name: <code>{user_input}</code>"
-    else:
-        return f"❌ Failed to change name: {r.text}"
+    return await patch_service(context, svc_id, payload, f"✨ <b>Name Updated!</b>\nNew Name: <code>{html.escape(user_input)}</code>", "Failed to change name")
         
 async def update_start_command(context, svc_id, user_input):
     payload = { "serviceDetails": {
             "envSpecificDetails": { "startCommand": user_input.strip() }
         } }
-    url = f"{RENDER_URL}/services/{svc_id}"
-    r = requests.patch(url, json=payload, headers=get_headers(context))
-    if r.status_code == 200:
-        return f"🚀 <b>Start Command Updated!</b>\nNew Command: <code>{user_input}</code>"
-    else:
-        return f"❌ Failed to update start command: {r.text}"
+    return await patch_service(context, svc_id, payload, f"🚀 <b>Start Command Updated!</b>\nNew Command: <code>{html.escape(user_input)}</code>", "Failed to update start command")
 
 async def update_build_command(context, svc_id, user_input):
     payload = { "serviceDetails": {
             "envSpecificDetails": { "buildCommand": user_input.strip() }
         } }
-    url = f"{RENDER_URL}/services/{svc_id}"
-    r = requests.patch(url, json=payload, headers=get_headers(context))
-    if r.status_code == 200:
-        return f"🛠 <b>Build Command Updated!</b>\nNew Command: <code>{user_input}</code>"
-    else:
-        return f"❌ Failed to update build command: {r.text}"
+    return await patch_service(context, svc_id, payload, f"🛠 <b>Build Command Updated!</b>\nNew Command: <code>{html.escape(user_input)}</code>", "Failed to update build command")
 
 async def update_build_filter(context, svc_id, user_input):
     paths = [p.strip() for p in re.split(r'[,\n]', user_input) if p.strip()]    
     if not paths:
         return "❌ No valid paths provided."
     payload = { "buildFilter": { "ignoredPaths": paths } }
-    url = f"{RENDER_URL}/services/{svc_id}"
-    r = requests.patch(url, json=payload, headers=get_headers(context))    
-    if r.status_code == 200:
-        path_list = ", ".join([f"<code>{p}</code>" for p in paths])
-        return f"🔍 <b>Build Filter Updated!</b>\nIgnored Paths: {path_list}"
-    else:
-        return f"❌ Failed to update filter: {r.text}"
+    path_list = ", ".join([f"<code>{html.escape(p)}</code>" for p in paths])
+    return await patch_service(context, svc_id, payload, f"🔍 <b>Build Filter Updated!</b>\nIgnored Paths: {path_list}", "Failed to update filter")
 
 async def delete_render_service(context, svc_id, status):
     if status == "ok":
-        url = f"{RENDER_URL}/services/{svc_id}"
-        r = requests.delete(url, headers=get_headers(context))
+        r = await render_delete(f"/services/{svc_id}", context)
         if r.status_code == 204:
             text = f"🗑 <b>Service Deleted.</b>"
         elif r.status_code == 404:
             text = "❌ Service not found. It may have already been deleted."
         else:
-            text = f"❌ Failed to delete service: {r.text}"
+            text = render_error_text("Failed to delete service", r)
     else:
         text = "🚫 Deletion cancelled by you!"
-    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data=f"deleteservice_{svc_id}")]])
+    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data=f"deleteservice:{svc_id}")]])
     return text, reply_markup
 
 async def handle_reply_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -468,278 +809,406 @@ async def handle_reply_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     prompt_text = prompt_msg.text
     user_input = update.message.text.strip()
     if "broadcast" in prompt_text:
-        result_msg = await broadcast(update, context)
-        await update.message.reply_text(result_msg)
+        await broadcast(update, context)
         return
     elif "API" in prompt_text:
-        test_res = requests.get(
-            "https://api.render.com/v1/owners", 
-            headers={"Authorization": f"Bearer {user_input}"}
+        # /users is fetched alongside the key check so the first /accountinfo is served from cache.
+        headers = render_headers(user_input)
+        test_res, _ = await asyncio.gather(
+            render_get("/owners", context, headers=headers, cache=True),
+            render_get("/users", context, headers=headers, cache=True),
         )
         if test_res.status_code == 200:
             context.user_data["api_key"] = user_input
-            await update.message.reply_html(
-                "✅ <b>Login successful!</b> You can now use management commands.\n\n"
-                "<i>📌 You have to re-login if the bot gets updates and so your API key gets cleared.</i>\n\n"
-                "If you want to logout, send /logout and your API key will be cleared.",
-            )
+            context.user_data["render_headers"] = headers
+            context.user_data.pop("owner_id", None)
+            remember_owner_id(context, test_res)
+            # Warm the services listing while the user reads the reply, so the first picker opens from cache.
+            context.application.create_task(render_get("/services", context, params={"limit": 50}, cache=True))
+            await update.message.reply_html(LOGIN_SUCCESS_TEXT)
         else:
             await update.message.reply_html("❌ <b>Invalid Key.</b> Please try /login again.")
         return
-    match = re.search(r"srv-[a-z0-9]+", prompt_text)
-    if not match:
+    match = REPLY_PROMPT_RE.match(prompt_text)
+    action = match and REPLY_ROUTES.get(match.group(2))
+    if not action:
         return
-    svc_id = match.group(0)
-    if "add or update" in prompt_text:
-        result_msg = await update_env_variable(context, svc_id, user_input)
-    elif "list" in prompt_text:
-        result_msg = await update_full_env(context, svc_id, user_input)
-    elif "name" in prompt_text:
-        result_msg = await change_service_name(context, svc_id, user_input)
-    elif "Start" in prompt_text:
-        result_msg = await update_start_command(context, svc_id, user_input)
-    elif "Build" in prompt_text:
-        result_msg = await update_build_command(context, svc_id, user_input)
-    elif "IGNORE" in prompt_text:
-        result_msg = await update_build_filter(context, svc_id, user_input)
-    await update.message.reply_html(result_msg)
+    result_msg = await REPLY_HANDLERS[action](context, match.group(1), user_input)
+    # A multi-line /updatenv reports one line per key, which can run past Telegram's message limit.
+    for chunk in split_message(result_msg):
+        await update.message.reply_html(chunk)
 
 async def action_picker(update: Update, context: ContextTypes.DEFAULT_TYPE):
     headers = get_headers(context)
     if not headers:
-        await update.message.reply_text("❌ You are not logged in.\nSend /login")
+        await reply_or_edit(update, NOT_LOGGED_IN_TEXT)
+        return
     if update.message:
         command = update.message.text.replace("/", "").lower()
     else:
-        command = update.callback_query.data.split("_")[1]
-    res = requests.get(f"{RENDER_URL}/services", headers=headers)
+        command = update.callback_query.data.partition(":")[2]
+    res = await render_get("/services", context, params={"limit": 50}, cache=True)
     if res.status_code == 200:
+        items = json_loads(res.content)
+        if command in ("suspend", "resume"):
+            # The list already says which services are suspended, so only offer ones the action applies to.
+            want_suspended = command == "resume"
+            items = [item for item in items if (item['service']['suspended'] != "not_suspended") == want_suspended]
+            if not items:
+                await reply_or_edit(update, f"📭 No services to {command}.")
+                return
+        if not items:
+            await reply_or_edit(update, NO_SERVICES_TEXT)
+            return
         text = "<b>Select a service:</b>"
-        keyboard = [[InlineKeyboardButton(item['service']['name'], callback_data=f"{command}_{item['service']['id']}")] for item in res.json()]
-        if update.message:
-            await update.message.reply_html(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        else:
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="HTML")
+        buttons = [InlineKeyboardButton(short_name(item['service']['name'], PICKER_LABEL_LIMIT), callback_data=f"{command}:{item['service']['id']}") for item in items]
+        keyboard = [buttons[i:i + PICKER_COLUMNS] for i in range(0, len(buttons), PICKER_COLUMNS)]
+        await reply_or_edit(update, text, InlineKeyboardMarkup(keyboard))
 # --- MAIN INTERACTION ROUTER ---
-async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
+SERVICE_VIEWS = {
+    "view": get_service_info,
+    "deploy": trigger_deploy,
+    "canceldeploy": cancel_last_deploy,
+    # Opening deploy info may reuse the deploy fetched for /services or the service view; Refresh always refetches.
+    "deployinfo": partial(get_last_deploy, cache=True),
+    "listenv": fetch_env_vars,
+    "suspend": partial(toggle_suspension, action="suspend"),
+    "resume": partial(toggle_suspension, action="resume"),
+}
+REPLY_PROMPTS = {
+    "updatenv": (
+        "✍️ Please reply to this message with the <b>environment variable</b> you want to add or update.\n\n<b>Format</b> (one per line for several):\n<code>KEY = VALUE</code>"
+    ),
+    "updatefullenv": (
+        "✍️ Please reply to this message with your new <b>environment variables</b> list.\n<b>Format</b> (one per line):\n<code>KEY1 = VALUE1\nKEY2 = VALUE2</code>\n\n"
+    ),
+    "rename": (
+        "✍️ Please reply to this message with the <b>NEW name</b> you want to set.\n\n"
+        "<i>Use lowercase, numbers, and hyphens only.</i>"
+    ),
+    "changestartcmd": (
+        "✍️ Please reply to this message with the <b>NEW Start Command</b> you want to set.\n\n"
+        "Example: <code>python main.py</code> or <code>npm start</code>"
+    ),
+    "changebuildcmd": (
+        "✍️ Please reply to this message with the <b>NEW Build Command</b> you want to set.\n\n"
+        "Example: <code>npm install && npm run build</code>"
+    ),
+    "updatebuildfilter": (
+        "✍️ Please reply to this message with the <b>paths</b> to IGNORE for your service.\n"
+        "Separate them with commas or new lines.\n\n"
+        "Example:\n<code>README.md, docs/*, .gitignore</code>"
+    ),
+}
+
+@admin_only
+async def cb_broadcast(update, context, action, arg):
     query = update.callback_query
-    data = query.data
-    if data == "broadcast":
-        await query.answer()
-        await query.message.reply_text(
-            "Enter a message to broadcast 📢:",
-            reply_markup=ForceReply(selective=True)
-        )
-        return
-    elif data == "refresh":
-        await query.answer()
-        await admin(update, context)
-        return
-    elif data == "get_ids":
-        await query.answer()
-        if os.path.exists("users.txt"):
-            await query.message.reply_document("users.txt", caption="Here is the current user list.")
-        else:
-            await query.answer("File not found!", show_alert=True)
-        return
-    elif data.startswith("refresh"):
-        _, type, svc_id = data.split("_")
-        if type == "logs":
-            text, markup = await get_service_logs(context, svc_id)
-        else:
-            text, markup = await get_last_deploy(context, svc_id)
-        try:
-            await query.edit_message_text(text, reply_markup=markup, parse_mode="MARKDOWN" if type == "logs" else "HTML")
-            await query.answer("Refreshed! ✨", show_alert=True)
-        except Exception as e:
-            await query.answer("🔔 No new updates yet.", show_alert=True)
-        return
-    elif data.startswith("back"):
-        await query.answer()
-        action = data.split("_")[1]
-        if action == "services":
-            await services(update, context)
-        else:
-            await action_picker(update, context)
-        return
-    elif data.startswith("logout"):
-        await query.answer()
-        status = data.split("_")[1]
-        if status == "ok":
-            del context.user_data["api_key"]
-            await query.message.delete()
-            await query.message.reply_html("🔒 <b>Logged out.</b> Your API key has been cleared.")
-        else:
-            await query.message.delete()
-            await query.message.reply_text("🚫 Logout cancelled by you!")
-        return
-    elif data.startswith("adset"):
-        await query.answer()
-        _, status, svc_id = data.split("_")
-        msg, markup= await toggle_auto_deploy(context, svc_id, status)
-        await query.edit_message_text(msg, reply_markup=markup, parse_mode="HTML")
-        return
-    elif data.startswith("delenv"):
+    await query.answer()
+    await query.message.reply_text(
+        "Enter a message to broadcast 📢:",
+        reply_markup=ForceReply(selective=True)
+    )
+
+@admin_only
+async def cb_admin_refresh(update, context, action, arg):
+    await update.callback_query.answer()
+    await admin(update, context)
+
+@admin_only
+async def cb_get_ids(update, context, action, arg):
+    query = update.callback_query
+    if os.path.exists("users.txt"):
         await query.answer()
-        delwht, key, svc_id = data.split("__")
-        msg, markup = await delete_env_variable(context, svc_id, key)
-        await query.edit_message_text(msg, reply_markup=markup, parse_mode="HTML")
+        await query.message.reply_document("users.txt", caption="Here is the current user list.")
+    else:
+        await query.answer("File not found!", show_alert=True)
+
+async def cb_refresh(update, context, action, arg):
+    query = update.callback_query
+    type, _, svc_id = arg.partition(":")
+    if not svc_id:
+        await query.answer("Unknown action.")
         return
-    elif data.startswith("delsvc"):
-        await query.answer()
-        _, status, svc_id = data.split("_")
-        msg, markup = await delete_render_service(context, svc_id, status)
-        await query.edit_message_text(msg, reply_markup=markup, parse_mode="HTML")
+    document = None
+    if type == "logs":
+        text, markup, document = await get_service_logs(context, svc_id)
+    else:
+        text, markup = await get_last_deploy(context, svc_id)
+    rendered = context.user_data.setdefault("rendered", {})
+    message_key = (query.message.chat_id, query.message.message_id)
+    # Oversized logs always edit to the same placeholder text, so the file's contents have to count too.
+    fingerprint = hash((text, markup, document and document.getvalue()))
+    if rendered.get(message_key) == fingerprint:
+        await query.answer("🔔 No new updates yet.", show_alert=True)
         return
-    action, svc_id = data.split("_")
-    if action == "deploy":
-        await query.answer()
-        msg, markup = await trigger_deploy(context, svc_id)
-    elif action == "canceldeploy":
-        await query.answer()
-        msg, markup = await cancel_last_deploy(context, svc_id)
-    elif action == "deployinfo":
-        await query.answer()
-        msg, markup = await get_last_deploy(context, svc_id)
-    elif action == "toggleautodeploy":
-        await query.answer()
+    if document:
+        await query.message.reply_document(document=document)
+    try:
+        await query.edit_message_text(text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN if type == "logs" else ParseMode.HTML)
+        await query.answer("Refreshed! ✨", show_alert=True)
+    except BadRequest as e:
+        if "not modified" not in str(e):
+            raise
+        logger.debug("Refresh of %s for %s left the message unchanged: %s", type, svc_id, e)
+        await query.answer("Refreshed! ✨" if document else "🔔 No new updates yet.", show_alert=True)
+    # Only the most recently refreshed messages are remembered, oldest first out.
+    rendered.pop(message_key, None)
+    rendered[message_key] = fingerprint
+    while len(rendered) > REFRESH_MEMORY:
+        del rendered[next(iter(rendered))]
+
+async def cb_back(update, context, action, arg):
+    await update.callback_query.answer()
+    if arg == "services":
+        await services(update, context)
+    else:
+        await action_picker(update, context)
+
+async def cb_logout(update, context, action, arg):
+    query = update.callback_query
+    await query.answer()
+    if arg == "ok":
+        api_key = context.user_data.pop("api_key", None)
+        context.user_data.pop("render_headers", None)
+        context.user_data.pop("owner_id", None)
+        if api_key:
+            forget_render_key(api_key)
+        await query.edit_message_text("🔒 <b>Logged out.</b> Your API key has been cleared.")
+    else:
+        await query.edit_message_text("🚫 Logout cancelled by you!")
+
+async def cb_adset(update, context, action, arg):
+    query = update.callback_query
+    await query.answer()
+    status, _, svc_id = arg.partition(":")
+    msg, markup = await toggle_auto_deploy(context, svc_id, status)
+    await query.edit_message_text(msg, reply_markup=markup)
+
+async def cb_delenv(update, context, action, arg):
+    query = update.callback_query
+    await query.answer()
+    svc_id, _, key = arg.partition(":")
+    msg, markup = await delete_env_variable(context, svc_id, key)
+    await query.edit_message_text(msg, reply_markup=markup)
+
+async def cb_delsvc(update, context, action, arg):
+    query = update.callback_query
+    await query.answer(cache_time=CALLBACK_CACHE_TIME)
+    status, _, svc_id = arg.partition(":")
+    msg, markup = await delete_render_service(context, svc_id, status)
+    await query.edit_message_text(msg, reply_markup=markup)
+
+async def cb_service_view(update, context, action, svc_id):
+    query = update.callback_query
+    await query.answer(cache_time=CALLBACK_CACHE_TIME if action in DEDUPED_ACTIONS else 0)
+    msg, markup = await SERVICE_VIEWS[action](context, svc_id)
+    await edit_long_message(query, msg, reply_markup=markup)
+
+async def cb_logs(update, context, action, svc_id):
+    query = update.callback_query
+    await query.answer()
+    msg, markup, document = await get_service_logs(context, svc_id)
+    if document:
+        await query.message.reply_document(document=document)
+    await query.edit_message_text(msg, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+
+# Replies are routed by the plain-text first line of the prompt they answer.
+REPLY_PROMPT_RE = re.compile(r"Service ID: (srv-[a-z0-9]+)\n\n(.*)")
+REPLY_ROUTES = {
+    html.unescape(re.sub(r"<[^>]+>", "", prompt)).split("\n", 1)[0]: action
+    for action, prompt in REPLY_PROMPTS.items()
+}
+REPLY_HANDLERS = {
+    "updatenv": update_env_variable,
+    "updatefullenv": update_full_env,
+    "rename": change_service_name,
+    "changestartcmd": update_start_command,
+    "changebuildcmd": update_build_command,
+    "updatebuildfilter": update_build_filter,
+}
+async def cb_reply_prompt(update, context, action, svc_id):
+    query = update.callback_query
+    await query.answer()
+    await query.message.reply_html(
+        f"<b>Service ID: </b><code>{svc_id}</code>\n\n" + REPLY_PROMPTS[action],
+        reply_markup=ForceReply(selective=True)
+    )
+
+async def cb_toggleautodeploy(update, context, action, svc_id):
+    query = update.callback_query
+    await query.answer()
+    keyboard = [
+        [
+            InlineKeyboardButton("✅ Turn ON", callback_data=f"adset:on:{svc_id}"),
+            InlineKeyboardButton("🛑 Turn OFF", callback_data=f"adset:off:{svc_id}")
+        ],
+        BACK_ROWS["toggleautodeploy"]
+    ]
+    await query.edit_message_text(
+        f"⚙️ <b>Auto-Deploy Settings</b>\nChoose an action:",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def cb_deletenv(update, context, action, svc_id):
+    query = update.callback_query
+    await query.answer()
+    r, env_vars = await list_env_vars(context, svc_id)
+    if env_vars is not None:
         keyboard = [
-            [
-                InlineKeyboardButton("✅ Turn ON", callback_data=f"adset_on_{svc_id}"),
-                InlineKeyboardButton("🛑 Turn OFF", callback_data=f"adset_off_{svc_id}")
-            ],
-            [InlineKeyboardButton("⬅️ Back to services list", callback_data="back_toggleautodeploy")]
+            [InlineKeyboardButton(short_name(v['envVar']['key']), callback_data=f"delenv:{svc_id}:{v['envVar']['key']}") for v in env_vars],
+            BACK_ROWS["deletenv"]
         ]
         await query.edit_message_text(
-            f"⚙️ <b>Auto-Deploy Settings</b>\nChoose an action:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode="HTML"
-        )
-        return
-    elif action == "logs":
-        await query.answer()
-        msg, markup = await get_service_logs(context, svc_id)
-    elif action in ["suspend", "resume"]:
-        await query.answer()
-        msg, markup = await toggle_suspension(context, svc_id, action)
-    elif action == "listenv":
-        await query.answer()
-        msg, markup = await fetch_env_vars(context, svc_id)
-    elif action == "updatenv":
-        await query.answer()
-        msg = (
-            "📌 If you want to add or update more variables, tap on the service's button above again. ⬆️\n"
-            "Or send /updatefullenv to replace all environment variables with a new list.\n\n"
-            "<b>N.B. </b>After updating the environment variables via API, your web service won't be deployed automatically even if auto deploy is turned on. So, you have to do it manually."
-        )
-        await query.message.reply_html(
-            f"<b>Service ID: </b><code>{svc_id}</code>\n\n"
-            "✍️ Please reply to this message with the <b>environment variable</b> you want to add or update.\n\n<b>Format: </b>KEY = VALUE",
-            reply_markup=ForceReply(selective=True)
-        )
-        return
-    elif action == "updatefullenv":
-        await query.answer()
-        msg = (
-            "⚠️ <b>Warning:</b> This replaces EVERYTHING.\n\n"
-            "<b>N.B. </b>After updating the environment variables via API, your web service won't be deployed automatically even if auto deploy is turned on. So, you have to do it manually."
-        )
-        await query.message.reply_html(
-            f"<b>Service ID: </b><code>{svc_id}</code>\n\n"
-            "✍️ Please reply to this message with your new <b>environment variables</b> list.\n<b>Format</b> (one per line):\n<code>KEY1 = VALUE1\nKEY2 = VALUE2</code>\n\n",
-            reply_markup=ForceReply(selective=True)
-        )
-        return
-    elif action == "deletenv":
-        await query.answer()
-        r = requests.get(f"{RENDER_URL}/services/{svc_id}/env-vars", headers=get_headers(context))
-        if r.status_code == 200:
-            keyboard = [
-                [InlineKeyboardButton(v['envVar']['key'], callback_data=f"delenv__{v['envVar']['key']}__{svc_id}") for v in r.json()],
-                [InlineKeyboardButton("⬅️ Back to services list", callback_data="back_deletenv")]
-            ]
-            await query.edit_message_text(
-                "<b>📌 N.B. </b>After deleting a environment variable via API, your web service won't be deployed automatically even if auto deploy is turned on. So, you have to do it manually.\n\n"
-                "Select a <b>environment variable</b> to delete:",
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode="HTML"
-            )
-        else:
-            query.message.reply_text("❌ Error loading env vars")
-        return
-    elif action == "rename":
-        await query.answer()
-        await query.message.reply_html(
-            f"<b>Service ID: </b><code>{svc_id}</code>\n\n"
-            "✍️ Please reply to this message with the <b>NEW name</b> you want to set.\n\n"
-            "<i>Use lowercase, numbers, and hyphens only.</i>",
-            reply_markup=ForceReply(selective=True)
-        )
-        return
-    elif action == "changestartcmd":
-        await query.answer()
-        await query.message.reply_html(
-            f"<b>Service ID: </b><code>{svc_id}</code>\n\n"
-            f"✍️ Please reply to this message with the <b>NEW Start Command</b> you want to set.\n\n"
-            "Example: <code>python main.py</code> or <code>npm start</code>",
-            reply_markup=ForceReply(selective=True)
+            "<b>📌 N.B. </b>After deleting a environment variable via API, your web service won't be deployed automatically even if auto deploy is turned on. So, you have to do it manually.\n\n"
+            "Select a <b>environment variable</b> to delete:",
+            reply_markup=InlineKeyboardMarkup(keyboard)
         )
+    else:
+        await query.message.reply_text("❌ Error loading env vars")
+
+async def cb_deleteservice(update, context, action, svc_id):
+    query = update.callback_query
+    await query.answer()
+    keyboard = [
+        [
+            InlineKeyboardButton("⚠️ Yes, I'm sure!", callback_data=f"delsvc:ok:{svc_id}"),
+            InlineKeyboardButton("❌ Cancel", callback_data=f"delsvc:cancel:{svc_id}")
+        ],
+        BACK_ROWS["deleteservice"]
+    ]
+    await query.edit_message_text(
+        "<b>Are you sure you really want to delete this web service?</b>",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+CALLBACK_HANDLERS = {
+    "broadcast": cb_broadcast,
+    "admin_refresh": cb_admin_refresh,
+    "get_ids": cb_get_ids,
+    "refresh": cb_refresh,
+    "back": cb_back,
+    "logout": cb_logout,
+    "adset": cb_adset,
+    "delenv": cb_delenv,
+    "delsvc": cb_delsvc,
+    "logs": cb_logs,
+    "toggleautodeploy": cb_toggleautodeploy,
+    "deletenv": cb_deletenv,
+    "deleteservice": cb_deleteservice,
+    **dict.fromkeys(SERVICE_VIEWS, cb_service_view),
+    **dict.fromkeys(REPLY_PROMPTS, cb_reply_prompt),
+}
+
+# Buttons already sitting in chat history from before a callback was renamed.
+LEGACY_CALLBACK_DATA = {"refresh": "admin_refresh"}
+
+async def handle_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    action, _, arg = LEGACY_CALLBACK_DATA.get(query.data, query.data).partition(":")
+    handler = CALLBACK_HANDLERS.get(action)
+    if handler is None:
+        await query.answer("Unknown action.")
         return
-    elif action == "changebuildcmd":
+    if action not in KEYLESS_ACTIONS and not get_headers(context):
         await query.answer()
-        await query.message.reply_html(
-            f"<b>Service ID: </b><code>{svc_id}</code>\n\n"
-            f"✍️ Please reply to this message with the <b>NEW Build Command</b> you want to set.\n\n"
-            "Example: <code>npm install && npm run build</code>",
-            reply_markup=ForceReply(selective=True)
-        )
+        await query.edit_message_text(NOT_LOGGED_IN_TEXT)
         return
-    elif action == "updatebuildfilter":
-        await query.answer()
-        await query.message.reply_html(
-            f"<b>Service ID: </b><code>{svc_id}</code>\n\n"
-            "✍️ Please reply to this message with the <b>paths</b> to IGNORE for your service.\n"
-            "Separate them with commas or new lines.\n\n"
-            "Example:\n<code>README.md, docs/*, .gitignore</code>",
-            reply_markup=ForceReply(selective=True)
-        )
+    if action not in DEDUPED_ACTIONS:
+        await handler(update, context, action, arg)
         return
-    elif action == "deleteservice":
-        await query.answer()
-        keyboard = [
-            [
-                InlineKeyboardButton("⚠️ Yes, I'm sure!", callback_data=f"delsvc_ok_{svc_id}"),
-                InlineKeyboardButton("❌ Cancel", callback_data=f"delsvc_cancel_{svc_id}")
-            ],
-            [InlineKeyboardButton("⬅️ Back to services list", callback_data="back_deleteservice")]
-        ]
-        await query.edit_message_text(
-            "<b>Are you sure you really want to delete this web service?</b>",
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode="HTML"
-        )
+    message_id = query.message.message_id if query.message else query.inline_message_id
+    tap_key = (update.effective_user.id, message_id, query.data)
+    if tap_key in RECENT_TAPS:
+        await query.answer("⏳ Already on it, please wait.")
         return
-    elif action.startswith("view"):
-        await query.answer()
-        msg, markup = await get_service_info(context, svc_id)
-    else:
-        msg = "Unknown action."
-    await query.edit_message_text(msg, reply_markup=markup, parse_mode="MARKDOWN" if action == "logs" else "HTML")
+    RECENT_TAPS[tap_key] = True
+    try:
+        await handler(update, context, action, arg)
+    finally:
+        RECENT_TAPS.pop(tap_key, None)
 # --- MAIN RUNNER ---
+# Per-message view memos are rebuilt on demand, so only the login itself is written to disk.
+TRANSIENT_USER_DATA = frozenset({"services_view", "rendered"})
+
+class SessionPersistence(PicklePersistence):
+    async def update_user_data(self, user_id, data):
+        await super().update_user_data(user_id, {k: v for k, v in data.items() if k not in TRANSIENT_USER_DATA})
+
+# Ordered roughly by how often they are used; PTB checks handlers in order for every update.
+COMMAND_HANDLERS = (
+    ("services", services),
+    *((cmd, action_picker) for cmd in PICKER_COMMANDS),
+    ("accountinfo", get_account_info),
+    ("start", start),
+    ("help", help_command),
+    ("login", login),
+    ("logout", logout),
+    ("admin", admin),
+)
+
+async def on_startup(application):
+    await application.bot.set_my_commands(BOT_COMMANDS)
+    # Render's health check (and any uptime pinger) hits PORT with plain GETs in both polling and webhook mode.
+    await start_health_server(application)
+
+async def run_webhook(application):
+    # PTB's own webhook server can't also answer health checks on PORT, so updates arrive through handle_http instead.
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    async with application:
+        await on_startup(application)
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}/{TOKEN}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        await application.start()
+        await stopping.wait()
+        await application.stop()
+        await stop_health_server(application)
+    await close_http_client(application)
+
 def main():
-    threading.Thread(target=run_health_server, daemon=True).start()
-    app = Application.builder().token(TOKEN).build()
-    app.add_handler(CommandHandler("admin", admin))
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("login", login))
-    app.add_handler(CommandHandler("logout", logout))
-    app.add_handler(CommandHandler("services", services))
-    app.add_handler(CommandHandler("accountinfo", get_account_info))
-    for cmd in ["deploy", "deployinfo", "canceldeploy", "toggleautodeploy", "logs", "suspend", "resume", "listenv", "updatenv", "deletenv", "updatefullenv", "rename", "changestartcmd", "changebuildcmd", "updatebuildfilter", "deleteservice"]:
-        app.add_handler(CommandHandler(cmd, action_picker))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_reply_text))
-    app.add_handler(CallbackQueryHandler(handle_interaction))
-    app.run_polling()
+    if not TOKEN:
+        raise SystemExit("TOKEN environment variable is not set.")
+    if uvloop:
+        uvloop.install()
+    telegram_request = HTTPXRequest(
+        connection_pool_size=TELEGRAM_POOL_SIZE,
+        pool_timeout=5,
+        connect_timeout=3,
+        read_timeout=10,
+        http_version="2" if h2 else "1.1",
+    )
+    defaults = Defaults(parse_mode=ParseMode.HTML, link_preview_options=LinkPreviewOptions(is_disabled=True), block=False)
+    builder = (
+        Application.builder().token(TOKEN).defaults(defaults).request(telegram_request)
+        .concurrent_updates(True)
+        .post_init(on_startup).post_stop(stop_health_server).post_shutdown(close_http_client)
+    )
+    if PERSISTENCE_FILE:
+        # Only user_data (API key, owner ID) is worth keeping; bot_data holds the live health server.
+        builder.persistence(SessionPersistence(
+            filepath=PERSISTENCE_FILE,
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+        ))
+    app = builder.build()
+    app.add_handlers([
+        CallbackQueryHandler(handle_interaction),
+        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_reply_text),
+        *(CommandHandler(cmd, callback) for cmd, callback in COMMAND_HANDLERS),
+    ])
+    # Stopped only after the run returns, so records logged by the shutdown hooks are still written.
+    log_listener = start_logging()
+    try:
+        if WEBHOOK_URL:
+            asyncio.run(run_webhook(app))
+        else:
+            app.run_polling(allowed_updates=ALLOWED_UPDATES)
+    finally:
+        log_listener.stop()
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,226 @@
+import re
+import html
+import io
+import random
+import time
+import asyncio
+import logging
+import httpx
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+try:
+    import h2
+except ImportError:
+    h2 = None
+from functools import partial
+from cachetools import TTLCache
+
+RENDER_URL = "https://api.render.com/v1"
+logger = logging.getLogger(__name__)
+
+if orjson:
+    json_loads, json_dumps = orjson.loads, orjson.dumps
+else:
+    json_loads, json_dumps = json.loads, lambda obj: json.dumps(obj).encode()
+
+HTTP_CLIENT = httpx.AsyncClient(
+    base_url=RENDER_URL,
+    http2=h2 is not None,
+    timeout=httpx.Timeout(15.0),
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=75),
+)
+RENDER_RETRY_STATUSES = frozenset({429, 502, 503, 504})
+RENDER_MAX_ATTEMPTS = 4
+RENDER_MAX_BACKOFF = 8
+RENDER_STREAM_CHUNK = 64 * 1024
+# Bodies are read in chunks and abandoned past this size, so a runaway response can't exhaust the instance's memory.
+RENDER_MAX_RESPONSE_BYTES = 4 * 1024 * 1024
+# Both response caches are bounded by total body bytes, not entry count; kept above RENDER_MAX_RESPONSE_BYTES so any single body fits.
+RENDER_CACHE_BYTES = 16 * 1024 * 1024
+RENDER_GET_CACHE = TTLCache(maxsize=RENDER_CACHE_BYTES, ttl=15, getsizeof=lambda r: len(r.content) or 1)
+RENDER_INFLIGHT = {}
+# Last 200 response per GET that carried an ETag, revalidated with If-None-Match after the TTL cache expires.
+RENDER_ETAG_CACHE = TTLCache(maxsize=RENDER_CACHE_BYTES, ttl=600, getsizeof=lambda r: len(r.content) or 1)
+# Token bucket per API key, kept under Render's per-key request limits so bursts don't end in 429s.
+RENDER_RATE_PER_SEC = 6
+RENDER_RATE_BURST = 20
+RENDER_RATE_BUCKETS = TTLCache(maxsize=1024, ttl=300)
+# Caps in-flight Render calls across all users, so a burst queues here instead of timing out waiting for a pooled connection.
+RENDER_MAX_CONCURRENCY = 16
+RENDER_CONCURRENCY = asyncio.Semaphore(RENDER_MAX_CONCURRENCY)
+SERVICE_PATH_RE = re.compile(r"/services/srv-[a-z0-9]+")
+
+def render_headers(api_key):
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Accept": "application/json",
+        "Content-Type": "application/json"
+    }
+
+def get_headers(context):
+    # Built once per login and kept beside the key in user_data, so logout drops both together.
+    headers = context.user_data.get("render_headers")
+    if headers is None:
+        api_key = context.user_data.get("api_key")
+        if not api_key:
+            return None
+        headers = context.user_data["render_headers"] = render_headers(api_key)
+    return headers
+
+def invalidate_render_cache(auth, path):
+    match = SERVICE_PATH_RE.match(path)
+    prefix = match.group(0) if match else path
+    for key in list(RENDER_GET_CACHE):
+        if key[0] == auth and (key[1].startswith(prefix) or key[1] == "/services"):
+            RENDER_GET_CACHE.pop(key, None)
+
+def forget_render_key(api_key):
+    # Drops every cached response and rate-limit bucket held under a key, e.g. once its user logs out.
+    auth = f"Bearer {api_key}"
+    for cache in (RENDER_GET_CACHE, RENDER_ETAG_CACHE):
+        for key in [key for key in cache if key[0] == auth]:
+            cache.pop(key, None)
+    RENDER_RATE_BUCKETS.pop(auth, None)
+
+def seed_render_cache(context, path, payload):
+    headers = get_headers(context)
+    if headers:
+        RENDER_GET_CACHE[(headers["Authorization"], path, ())] = httpx.Response(200, content=json_dumps(payload))
+
+def reserve_render_slot(auth):
+    now = time.monotonic()
+    tokens, updated = RENDER_RATE_BUCKETS.get(auth, (RENDER_RATE_BURST, now))
+    tokens = min(RENDER_RATE_BURST, tokens + (now - updated) * RENDER_RATE_PER_SEC) - 1
+    RENDER_RATE_BUCKETS[auth] = (tokens, now)
+    return max(0.0, -tokens / RENDER_RATE_PER_SEC)
+
+async def wait_for_render_slot(auth):
+    delay = reserve_render_slot(auth)
+    if delay:
+        await asyncio.sleep(delay)
+
+def retry_delay(response, attempt):
+    try:
+        delay = float(response.headers.get("Retry-After", "") if response is not None else "")
+    except ValueError:
+        delay = 2 ** attempt
+    return min(delay, RENDER_MAX_BACKOFF) + random.random()
+
+async def make_render_request(method, path, context, headers=None, json=None, cache=False, **kwargs):
+    method = method.upper()
+    if headers is None:
+        headers = get_headers(context)
+    auth = headers.get("Authorization") if headers else None
+    if method == "GET":
+        request_key = (auth, path, tuple(sorted((kwargs.get("params") or {}).items())))
+        if cache and auth:
+            cached = RENDER_GET_CACHE.get(request_key)
+            if cached is not None:
+                return cached
+        # Identical GETs already in flight share one request instead of each hitting Render.
+        pending = RENDER_INFLIGHT.get(request_key)
+        if pending is None:
+            pending = RENDER_INFLIGHT[request_key] = asyncio.ensure_future(revalidate_render_get(request_key, path, headers, **kwargs))
+            pending.add_done_callback(lambda _: RENDER_INFLIGHT.pop(request_key, None))
+        r = await asyncio.shield(pending)
+        if cache and auth and r.status_code == 200:
+            RENDER_GET_CACHE[request_key] = r
+        return r
+    if json is not None:
+        kwargs["content"] = json_dumps(json)
+    r = await send_render_request(method, path, headers, **kwargs)
+    if r.is_success:
+        invalidate_render_cache(auth, path)
+    return r
+
+async def revalidate_render_get(request_key, path, headers, **kwargs):
+    stored = RENDER_ETAG_CACHE.get(request_key)
+    if stored is not None:
+        headers = {**(headers or {}), "If-None-Match": stored.headers["ETag"]}
+    r = await send_render_request("GET", path, headers, **kwargs)
+    if r.status_code == 304 and stored is not None:
+        return stored
+    if r.status_code == 200 and "ETag" in r.headers:
+        RENDER_ETAG_CACHE[request_key] = r
+    return r
+
+async def send_render_request(method, path, headers, **kwargs):
+    auth = headers.get("Authorization") if headers else None
+    for attempt in range(RENDER_MAX_ATTEMPTS):
+        await wait_for_render_slot(auth)
+        try:
+            async with RENDER_CONCURRENCY, HTTP_CLIENT.stream(method, path, headers=headers, **kwargs) as streamed:
+                body = await read_render_body(streamed)
+            # Rebuilt from the already-decoded body, so the encoding and length headers no longer apply.
+            response_headers = [(k, v) for k, v in streamed.headers.multi_items() if k not in ("content-encoding", "content-length")]
+            r = httpx.Response(streamed.status_code, headers=response_headers, content=body, request=streamed.request)
+        except RenderResponseTooLarge as e:
+            logger.warning("Render API %s %s: %s", method, path, e)
+            return render_failure(method, path, str(e))
+        except httpx.TransportError as e:
+            # Dropped connections and timeouts are retried too, except on POST where the request may have landed.
+            if method == "POST" or attempt == RENDER_MAX_ATTEMPTS - 1:
+                logger.warning("Render API %s %s failed with %r, giving up", method, path, e)
+                return render_failure(method, path, f"Render did not respond ({type(e).__name__})")
+            delay = retry_delay(None, attempt)
+            logger.warning("Render API %s %s failed with %r, retrying in %.1fs", method, path, e, delay)
+            await asyncio.sleep(delay)
+            continue
+        if r.status_code not in RENDER_RETRY_STATUSES or attempt == RENDER_MAX_ATTEMPTS - 1:
+            break
+        # A 5xx on POST may already have been applied (e.g. a deploy was queued), so only 429 is retried there.
+        if method == "POST" and r.status_code != 429:
+            break
+        delay = retry_delay(r, attempt)
+        logger.warning("Render API returned %s for %s %s, retrying in %.1fs", r.status_code, method, path, delay)
+        await asyncio.sleep(delay)
+    return r
+
+class RenderResponseTooLarge(ValueError):
+    pass
+
+def render_failure(method, path, message):
+    # Stands in for a response that never arrived, so callers report it through render_error_text like any other error.
+    return httpx.Response(502, content=json_dumps({"message": message}), request=httpx.Request(method, RENDER_URL + path))
+
+async def read_render_body(r):
+    if int(r.headers.get("Content-Length") or 0) > RENDER_MAX_RESPONSE_BYTES:
+        raise RenderResponseTooLarge(f"Render response for {r.request.url.path} exceeds {RENDER_MAX_RESPONSE_BYTES} bytes")
+    with io.BytesIO() as buf:
+        async for chunk in r.aiter_bytes(RENDER_STREAM_CHUNK):
+            buf.write(chunk)
+            if buf.tell() > RENDER_MAX_RESPONSE_BYTES:
+                raise RenderResponseTooLarge(f"Render response for {r.request.url.path} exceeds {RENDER_MAX_RESPONSE_BYTES} bytes")
+        return buf.getvalue()
+
+async def stream_render_get(path, context, **kwargs):
+    headers = get_headers(context)
+    await wait_for_render_slot(headers.get("Authorization") if headers else None)
+    try:
+        async with RENDER_CONCURRENCY, HTTP_CLIENT.stream("GET", path, headers=headers, **kwargs) as r:
+            return r.status_code, await read_render_body(r)
+    except RenderResponseTooLarge as e:
+        logger.warning("Render API GET %s: %s", path, e)
+        return 502, str(e).encode()
+    except httpx.TransportError as e:
+        logger.warning("Render API GET %s failed with %r", path, e)
+        return 502, f"Render did not respond ({type(e).__name__})".encode()
+
+def render_error_text(what, r):
+    try:
+        detail = json_loads(r.content).get("message")
+    except (ValueError, AttributeError):
+        detail = None
+    return f"❌ {what}: {html.escape(detail or r.text or str(r.status_code))}"
+
+render_get = partial(make_render_request, "GET")
+render_post = partial(make_render_request, "POST")
+render_put = partial(make_render_request, "PUT")
+render_patch = partial(make_render_request, "PATCH")
+render_delete = partial(make_render_request, "DELETE")
+
+async def close_http_client(application):
+    await HTTP_CLIENT.aclose()
@@ -0,0 +1,45 @@
+import json
+import types
+import unittest
+
+import httpx
+
+import bot
+import render_api
+
+PEM = "-----BEGIN CERTIFICATE-----\nMIIBszCCAVmgAwIBAgIUQ2Fu==\n-----END CERTIFICATE-----"
+
+
+class UpdateEnvVariableTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.puts = []
+
+        def handler(request):
+            self.puts.append((request.url.path.rsplit("/", 1)[-1], json.loads(request.content)["value"]))
+            return httpx.Response(200, json={})
+
+        self.client = render_api.HTTP_CLIENT
+        render_api.HTTP_CLIENT = httpx.AsyncClient(base_url=render_api.RENDER_URL, transport=httpx.MockTransport(handler))
+        self.context = types.SimpleNamespace(user_data={"api_key": "rnd_test"}, bot_data={})
+
+    async def asyncTearDown(self):
+        await render_api.HTTP_CLIENT.aclose()
+        render_api.HTTP_CLIENT = self.client
+
+    async def test_padded_pem_is_one_value(self):
+        text = await bot.update_env_variable(self.context, "srv-abc", f"CERT = {PEM}")
+        self.assertEqual(self.puts, [("CERT", PEM)])
+        self.assertTrue(text.startswith("✅"))
+
+    async def test_one_pair_per_line(self):
+        await bot.update_env_variable(self.context, "srv-abc", "A = 1\nB_2=two")
+        self.assertCountEqual(self.puts, [("A", "1"), ("B_2", "two")])
+
+    async def test_missing_equals_is_rejected(self):
+        text = await bot.update_env_variable(self.context, "srv-abc", "just text")
+        self.assertEqual(self.puts, [])
+        self.assertTrue(text.startswith("❌"))
+
+
+if __name__ == "__main__":
+    unittest.main()